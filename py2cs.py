@@ -6,38 +6,258 @@ Attempt to build a transpiler using OpenAI Codex:
 https://beta.openai.com/playground/p/default-english-to-python
 """
 
+import os
 import sys
-import argparse
+import mmap
+import stat
 import ast
+import functools
 
-from token import *
 from ast import *
-
-# Emit C sharp code to a file from an ast tree, taking the filepath and tree as input.
+from types import MappingProxyType
+
+# C# symbols for the binary and comparison operators, keyed by the operator node class.
+_OP_SYM = MappingProxyType({
+    Add: '+',
+    Sub: '-',
+    Mult: '*',
+    Div: '/',
+    Mod: '%',
+    Pow: '**',
+    LShift: '<<',
+    RShift: '>>',
+    BitOr: '|',
+    BitXor: '^',
+    BitAnd: '&',
+    FloorDiv: '//',
+    Eq: '==',
+    NotEq: '!=',
+    Lt: '<',
+    LtE: '<=',
+    Gt: '>',
+    GtE: '>=',
+})
+
+# The binary and comparison operator symbols padded with the spaces around them, as emitted bytes.
+_OP_FRAGMENT = MappingProxyType({
+    op: (' ' + symbol + ' ').encode() for op, symbol in _OP_SYM.items()
+})
+
+# C# equivalents of the Python builtin functions, keyed by the function name.
+_BUILTIN = MappingProxyType({
+    'print': 'Console.WriteLine',
+    'input': 'Console.ReadLine',
+})
+
+# Escape sequences for the characters that cannot appear as is inside a C# string literal,
+# including every character C# treats as a newline, plus NUL for readability.
+_CS_ESCAPE_TABLE = str.maketrans({
+    '"': '\\"',
+    '\\': '\\\\',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\t': '\\t',
+    '\0': '\\0',
+    '\x85': '\\u0085',
+    '\u2028': '\\u2028',
+    '\u2029': '\\u2029',
+})
+
+# Operand node types that a unary operator can be emitted directly in front of, without parentheses.
+_UNARY_BARE_OPERANDS = frozenset({Name, Constant, Call})
+
+# C# types of the expression nodes, keyed by the node class.
+_RET_TYPE = MappingProxyType({
+    Name: 'dynamic',
+    Call: 'dynamic',
+    BinOp: 'dynamic',
+    Compare: 'bool',
+    UnaryOp: 'dynamic',
+    Lambda: 'dynamic',
+    FunctionDef: 'dynamic',
+    type(None): 'dynamic',
+})
+
+# C# types of the Constant node values, keyed by the value type.
+_CONSTANT_RET_TYPE = MappingProxyType({
+    int: 'int',
+    float: 'int',
+    complex: 'int',
+    str: 'string',
+})
+
+# C# symbols for the unary operators, keyed by the operator node class.
+_UNARY_SYM = MappingProxyType({
+    USub: '-',
+    UAdd: '+',
+    Not: '!',
+    Invert: '~',
+})
+
+# The unary operator symbols as emitted bytes.
+_UNARY_FRAGMENT = MappingProxyType({
+    op: symbol.encode() for op, symbol in _UNARY_SYM.items()
+})
+
+# The C# code wrapped around the walked module, which becomes the body of the Main method.
+_PROLOGUE = b"using System;\npublic class Program {\n\tpublic static void Main(string[] args) {\n"
+_EPILOGUE = b"}\n}\n"
+
+# Fixed C# syntax fragments emitted by the walk_* functions.
+# All emitted C# is written to the output as bytes, so these are bytes as well.
+_BLOCK_OPEN = b') {\n'
+_BLOCK_CLOSE = b'\n}'
+_CLASS = b'class '
+_BASES = b' : '
+_CLASS_OPEN = b' {\n'
+_RETURN = b'return '
+_RETURN_END = b';'
+_STMT_END = b';\n'
+_ASSIGN = b' = '
+_FOR_OPEN = b'for ('
+_WHILE_OPEN = b'while ('
+_IF_OPEN = b'if ('
+_IF_BODY = b') {\n\t'
+_IF_CLOSE = b'}\n'
+_ELSE_OPEN = b'else {\n\t'
+_NEWLINE = b'\n'
+_COMMA = b', '
+_DYNAMIC = b'dynamic '
+_NULL_INIT = b' = null;\n'
+_LAMBDA_OPEN = b'('
+_LAMBDA_ARROW = b') => '
+_CALL_CLOSE = b')'
+_PAREN_OPEN = b'('
+_PAREN_CLOSE = b')'
+
+# Sources of at least this many bytes are emitted directly into a memory-mapped output file.
+# Smaller sources are buffered in a bytearray, which avoids wasting a page-aligned mapping on them.
+MMAP_THRESHOLD = 1 << 20
+
+# The initial size of the output mapping relative to the size of the source.
+MMAP_GROWTH = 2
+
+
+class MMapWriter:
+    # An output buffer that writes the emitted C# code straight into a memory-mapped file.
+    # It has the same extend method as a bytearray, so it can be passed to every walk_* function.
+    #
+    # The file is mapped at a generous size up front, doubled whenever it runs out of room,
+    # and truncated to the number of bytes actually written when the writer is closed.
+    # Growing unmaps, extends and remaps the file instead of using mmap.resize,
+    # which is not available on platforms without mremap such as macOS and the BSDs.
+    def __init__(self, fd, size):
+        self.fd = fd
+        self.size = max(size, mmap.PAGESIZE)
+        self.pos = 0
+        os.ftruncate(fd, self.size)
+        self.mm = mmap.mmap(fd, self.size, access=mmap.ACCESS_WRITE)
+
+    def extend(self, b):
+        end = self.pos + len(b)
+        if end > self.size:
+            self.grow(end)
+        self.mm[self.pos:end] = b
+        self.pos = end
+
+    def grow(self, needed):
+        size = self.size
+        while needed > size:
+            size *= 2
+        self.mm.close()
+        os.ftruncate(self.fd, size)
+        self.mm = mmap.mmap(self.fd, size, access=mmap.ACCESS_WRITE)
+        self.size = size
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        os.ftruncate(self.fd, self.pos)
 
 
-def emit_csharp(filepath, tree):
-    # Open the filepath to write
-    # Walk the AST tree and emit C# code to the file descriptor
-    with open(filepath, 'w') as f:
-        f.write("using System;\n")
-        f.write(
-            "public class Program {\n\tpublic static void Main(string[] args) {\n")
-        f.write(walk_tree(tree))
-        f.write("}\n}\n")
+# Emit C sharp code to a file from an ast tree, taking the filepath and tree as input.
+# The size_hint is the size of the source in bytes, and decides how the output is buffered.
 
 
-def walk_tree(tree):
+def emit_csharp(filepath, tree, size_hint=0):
+    if size_hint < MMAP_THRESHOLD:
+        # Walk the AST tree into a single bytearray output buffer,
+        # then write the C# code to the file in one go.
+        out = bytearray()
+        emit_program(tree, out)
+        with open(filepath, 'wb') as f:
+            f.write(out)
+    else:
+        # Walk the AST tree directly into the memory-mapped output file.
+        # The writer is closed even if the walk fails, so the file is truncated
+        # to what was written instead of being left padded with NUL bytes.
+        fd = os.open(filepath, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            out = MMapWriter(fd, size_hint * MMAP_GROWTH)
+            try:
+                emit_program(tree, out)
+            finally:
+                out.close()
+        finally:
+            os.close(fd)
+
+
+def emit_program(tree, out):
+    # Wrap the walked module in a Program class with a Main method.
+    out.extend(_PROLOGUE)
+    walk_tree(tree, out)
+    out.extend(_EPILOGUE)
+
+
+def walk_tree(tree, out: bytearray):
     # The root node of the AST tree is the module node.
     # The module node contains a list of statements.
     # We will walk the list of statements and emit C# code for each statement.
-    csharp = ''
+    # Every walk_* function extends the out buffer with its C# fragments as bytes
+    # instead of returning a new string.
+    # The scope set holds the names already declared at module level.
+    # The statements are walked in order in this process: handing the function and class
+    # definitions to worker processes costs far more in pickling the AST than walking them.
+    scope = set()
+    declare_block_names(tree.body, out, scope)
     for statement in tree.body:
-        csharp += walk_statement(statement)
-    return csharp
-
-
-def walk_statement(statement: stmt):
+        walk_statement(statement, out, scope)
+
+
+def declare_block_names(statements: list[stmt], out: bytearray, scope: set[str]):
+    # Python scopes names by function, but C# scopes every {} block separately.
+    # A name first assigned inside an if, for or while block would not be visible after the block,
+    # and declaring it again in the enclosing block is an error (CS0136).
+    # So declare those names as dynamic at the start of the body and add them to the scope,
+    # which makes every assignment inside the nested blocks a plain assignment.
+    first_nested = {}
+    find_assigned_names(statements, first_nested, False)
+    for name, nested in first_nested.items():
+        if nested and name not in scope:
+            scope.add(name)
+            out.extend(_DYNAMIC)
+            out.extend(name.encode())
+            out.extend(_NULL_INIT)
+
+
+def find_assigned_names(statements: list[stmt], first_nested: dict[str, bool], nested: bool):
+    # Record every assigned name in first_nested, in order of appearance,
+    # mapped to whether its first assignment is inside a nested if, for or while block.
+    # Function and class definitions have a scope of their own and are not searched.
+    for statement in statements:
+        statement_type = type(statement)
+        if statement_type is Assign:
+            target = statement.targets[0]
+            if type(target) is Name:
+                first_nested.setdefault(target.id, nested)
+        elif statement_type is If:
+            find_assigned_names(statement.body, first_nested, True)
+            find_assigned_names(statement.orelse, first_nested, True)
+        elif statement_type is For or statement_type is While:
+            find_assigned_names(statement.body, first_nested, True)
+
+
+def walk_statement(statement: stmt, out: bytearray, scope: set[str]):
     # The statement node can be one of the following:
     # - FunctionDef
     # - ClassDef
@@ -47,27 +267,26 @@ def walk_statement(statement: stmt):
     # - While
     # - If
     # - Expression
-    if isinstance(statement, FunctionDef):
-        return walk_function_def(statement)
-    elif isinstance(statement, ClassDef):
-        return walk_class_def(statement)
-    elif isinstance(statement, Return):
-        return walk_return(statement)
-    elif isinstance(statement, Assign):
-        return walk_assign(statement)
-    elif isinstance(statement, For):
-        return walk_for(statement)
-    elif isinstance(statement, While):
-        return walk_while(statement)
-    elif isinstance(statement, If):
-        return walk_if(statement)
-    elif isinstance(statement, Expr):
-        return walk_expression(statement.value) + ';\n'
-    else:
+    # Look up the walk function for the exact node type in the _STMT_DISPATCH table.
+    handler = _STMT_DISPATCH.get(type(statement))
+    if handler is None:
         raise Exception("Unsupported statement type: " + str(type(statement)))
+    handler(statement, out, scope)
 
 
-def walk_function_def(function_def: FunctionDef):
+def walk_expr_statement(expr_statement: Expr, out: bytearray, scope: set[str]):
+    # The expr_statement node contains the following fields:
+    # - value
+    #
+    # Example:
+    # print(a);
+    #
+    # Append the expression string followed by a semicolon to the output buffer.
+    walk_expression(expr_statement.value, out)
+    out.extend(_STMT_END)
+
+
+def walk_function_def(function_def: FunctionDef, out: bytearray, scope: set[str]):
     # The function_def node contains the following fields:
     # - name
     # - args
@@ -86,17 +305,22 @@ def walk_function_def(function_def: FunctionDef):
     # }
     #
     # First calculate the return type of the function_def node returns field using the get_expression_return_type function.
-    # Then calculate the argument list of the function_def node args field using the walk_argument_list function.
-    # Then calculate the body of the function_def node body field using the walk_statements function.
-    # Finally, return the function definition string.
+    # Then append the argument list of the function_def node args field using the walk_argument_list function.
+    # Then append the body of the function_def node body field using the walk_statements function.
+    # Finally, close the function definition in the output buffer.
     return_type = get_expression_return_type(function_def.returns)
     name = function_def.name
-    argument_list = walk_argument_list(function_def.args)
-    body = walk_statements(function_def.body)
-    return return_type + ' ' + name + '(' + argument_list + ') {\n' + body + '\n}'
+    out.extend((return_type + ' ' + name + '(').encode())
+    walk_argument_list(function_def.args, out)
+    out.extend(_BLOCK_OPEN)
+    # The function body gets its own scope, in which the arguments are already declared.
+    function_scope = {argument.arg for argument in function_def.args.args}
+    declare_block_names(function_def.body, out, function_scope)
+    walk_statements(function_def.body, out, function_scope)
+    out.extend(_BLOCK_CLOSE)
 
 
-def walk_class_def(class_def):
+def walk_class_def(class_def, out: bytearray, scope: set[str]):
     # The class_def node contains the following fields:
     # - name
     # - bases
@@ -128,14 +352,18 @@ def walk_class_def(class_def):
     # First calculate the name of the class_def node name field using the get_expression_name function.
     # Then calculate the base class list of the class_def node bases field using the get_expression_base_class_list function.
     # Then calculate the body of the class_def node body field using the walk_class_body function.
-    # Finally, return the class definition string.
+    # Finally, append the class definition to the output buffer.
     name = class_def.name
-    base_class_list = walk_base_class_list(class_def.bases)
-    body = walk_class_body(class_def.body)
-    return 'class ' + name + ' : ' + base_class_list + ' {\n' + body + '\n}'
+    out.extend(_CLASS)
+    out.extend(name.encode())
+    out.extend(_BASES)
+    walk_base_class_list(class_def.bases, out)
+    out.extend(_CLASS_OPEN)
+    walk_class_body(class_def.body, out, set())
+    out.extend(_BLOCK_CLOSE)
 
 
-def walk_base_class_list(base_class_list):
+def walk_base_class_list(base_class_list, out: bytearray):
     # The base_class_list node contains the following fields:
     # - bases
     #
@@ -154,11 +382,11 @@ def walk_base_class_list(base_class_list):
     # }
     #
     # First calculate the base class list string of the base_class_list node bases field using the walk_expression_list function.
-    # Then return the base class list string.
-    return walk_expression_list(base_class_list.bases)
+    # Then append the base class list string to the output buffer.
+    walk_expression_list(base_class_list.bases, out)
 
 
-def walk_class_body(class_body):
+def walk_class_body(class_body, out: bytearray, scope: set[str]):
     # The class_body node contains the following fields:
     # - body
     #
@@ -177,11 +405,11 @@ def walk_class_body(class_body):
     # }
     #
     # First calculate the body string of the class_body node body field using the walk_statements function.
-    # Then return the body string.
-    return walk_statements(class_body)
+    # Then append the body string to the output buffer.
+    walk_statements(class_body, out, scope)
 
 
-def walk_return(return_statement):
+def walk_return(return_statement, out: bytearray, scope: set[str]):
     # The return_statement node contains the following fields:
     # - value
     #
@@ -189,11 +417,13 @@ def walk_return(return_statement):
     # return a + b;
     #
     # First calculate the return expression string of the return_statement node value field using the walk_expression function.
-    # Then return the return statement string.
-    return 'return ' + walk_expression(return_statement.value) + ';'
+    # Then append the return statement string to the output buffer.
+    out.extend(_RETURN)
+    walk_expression(return_statement.value, out)
+    out.extend(_RETURN_END)
 
 
-def walk_assign(assign_statement: Assign):
+def walk_assign(assign_statement: Assign, out: bytearray, scope: set[str]):
     # The assign_statement node contains the following fields:
     # - targets
     # - value
@@ -202,13 +432,29 @@ def walk_assign(assign_statement: Assign):
     # a = b + c;
     #
     # Only assign to the value to first target in the targets list.
+    # A name that is already declared in the scope is assigned without a type,
+    # otherwise the name is added to the scope and declared with the type of the value.
     # First calculate the target string of the first target in the assign_statement node targets field using the walk_expression function.
-    # Then calculate the value string of the assign_statement node value field using the walk_expression function.
-    # Then return the assignment statement string.
-    return get_expression_return_type(assign_statement.value) + ' ' + walk_expression(assign_statement.targets[0]) + ' = ' + walk_expression(assign_statement.value) + ';\n'
-
-
-def walk_for(for_statement):
+    # Then calculate the value parts and type of the assign_statement node value field using the walk_expression_typed function.
+    # Then append the assignment statement string to the output buffer.
+    target = assign_statement.targets[0]
+    if type(target) is Name and target.id in scope:
+        out.extend(target.id.encode())
+        out.extend(_ASSIGN)
+        walk_expression(assign_statement.value, out)
+        out.extend(_STMT_END)
+        return
+    if type(target) is Name:
+        scope.add(target.id)
+    value_parts, value_type = walk_expression_typed(assign_statement.value)
+    out.extend((value_type + ' ').encode())
+    walk_expression(target, out)
+    out.extend(_ASSIGN)
+    walk_expression_parts(value_parts, out)
+    out.extend(_STMT_END)
+
+
+def walk_for(for_statement, out: bytearray, scope: set[str]):
     # The for_statement node contains the following fields:
     # - target
     # - iter
@@ -223,11 +469,17 @@ def walk_for(for_statement):
     # First calculate the target string of the for_statement node target field using the walk_expression function.
     # Then calculate the iter string of the for_statement node iter field using the walk_expression function.
     # Then calculate the body string of the for_statement node body field using the walk_statements function.
-    # Finally, return the for statement string.
-    return 'for (' + walk_expression(for_statement.target) + ' = ' + walk_expression(for_statement.iter) + ') {\n' + walk_statements(for_statement.body) + '\n}'
+    # Finally, append the for statement string to the output buffer.
+    out.extend(_FOR_OPEN)
+    walk_expression(for_statement.target, out)
+    out.extend(_ASSIGN)
+    walk_expression(for_statement.iter, out)
+    out.extend(_BLOCK_OPEN)
+    walk_statements(for_statement.body, out, scope)
+    out.extend(_BLOCK_CLOSE)
 
 
-def walk_while(while_statement):
+def walk_while(while_statement, out: bytearray, scope: set[str]):
     # The while_statement node contains the following fields:
     # - test
     # - body
@@ -241,11 +493,15 @@ def walk_while(while_statement):
     #
     # First calculate the test string of the while_statement node test field using the walk_expression function.
     # Then calculate the body string of the while_statement node body field using the walk_statements function.
-    # Finally, return the while statement string.
-    return 'while (' + walk_expression(while_statement.test) + ') {\n' + walk_statements(while_statement.body) + '\n}'
+    # Finally, append the while statement string to the output buffer.
+    out.extend(_WHILE_OPEN)
+    walk_expression(while_statement.test, out)
+    out.extend(_BLOCK_OPEN)
+    walk_statements(while_statement.body, out, scope)
+    out.extend(_BLOCK_CLOSE)
 
 
-def walk_if(if_statement: If):
+def walk_if(if_statement: If, out: bytearray, scope: set[str]):
     # The if_statement node contains the following fields:
     # - test
     # - body
@@ -258,20 +514,33 @@ def walk_if(if_statement: If):
     #
     # First calculate the test string of the if_statement node test field using the walk_expression function.
     # Then calculate the body string of the if_statement node body field using the walk_statements function.
-    # Finally, return the if statement string.
-    if (len(if_statement.orelse) == 0):
-        return 'if (' + walk_expression(if_statement.test) + ') {\n\t' + walk_statements(if_statement.body) + '}\n'
-    else:
-        return 'if (' + walk_expression(if_statement.test) + ') {\n\t' + walk_statements(if_statement.body) + '}\n' + 'else {\n\t' + walk_statements(if_statement.orelse) + '}\n'
-
-
-def walk_statements(statements: list[stmt]):
+    # Finally, append the if statement string to the output buffer.
+    extend = out.extend
+    orelse = if_statement.orelse
+    extend(_IF_OPEN)
+    walk_expression(if_statement.test, out)
+    extend(_IF_BODY)
+    walk_statements(if_statement.body, out, scope)
+    extend(_IF_CLOSE)
+    if (len(orelse) != 0):
+        extend(_ELSE_OPEN)
+        walk_statements(orelse, out, scope)
+        extend(_IF_CLOSE)
+
+
+def walk_statements(statements: list[stmt], out: bytearray, scope: set[str]):
     # Call walk_statement for each statement in the statements.body list.
-    # Return the statements string.
-    return '\n'.join([walk_statement(statement) for statement in statements])
+    # Append a newline separator between the statements directly to out.
+    # The functions used in the loop are kept in locals to avoid a global lookup per statement.
+    extend = out.extend
+    walk = walk_statement
+    for index, statement in enumerate(statements):
+        if index > 0:
+            extend(_NEWLINE)
+        walk(statement, out, scope)
 
 
-def walk_expression(expression: expr):
+def walk_expression(expression: expr, out: bytearray):
     # The expression node can be one of the following:
     # - BinOp
     # - UnaryOp
@@ -282,72 +551,76 @@ def walk_expression(expression: expr):
     # - Str
     # - Identifier
     # - New Class
-    # Have a switch statement covering all the cases above.
-    # For each case, call the appropriate walk function.
-    # The walk function should return the string representation of the expression.
-    if isinstance(expression, BinOp):
-        return walk_bin_op(expression)
-    if isinstance(expression, BoolOp):
-        return walk_bin_op(expression)
-    elif isinstance(expression, Compare):
-        return walk_comp_op(expression)
-    elif isinstance(expression, UnaryOp):
-        return walk_unary_op(expression)
-    elif isinstance(expression, Lambda):
-        return walk_lambda(expression)
-    elif isinstance(expression, Call):
-        return walk_call(expression)
-    elif isinstance(expression, Num):
-        return walk_num(expression)
-    elif isinstance(expression, Str):
-        return walk_str(expression)
-    elif isinstance(expression, Name):
-        return walk_name(expression)
-    else:
+    # Walk the expression with an explicit stack instead of recursing into every child node.
+    walk_expression_parts([expression], out)
+
+
+def walk_expression_typed(expression: expr):
+    # Dispatch the root node of the expression once, and return its parts together with the C# type of the expression.
+    # Passing the parts to walk_expression_parts walks the rest of the expression.
+    handler = _EXPR_DISPATCH.get(type(expression))
+    if handler is None:
         raise Exception("Unsupported expression type: " +
                         str(type(expression)))
+    parts = handler(expression)
+    if type(parts) is bytes:
+        parts = [parts]
+    return parts, get_expression_return_type(expression)
+
+
+def walk_expression_parts(parts: list, out: bytearray):
+    # The parts list contains bytes fragments and expression nodes in output order.
+    # Fragments are appended to out as they are popped off the stack.
+    # For expression nodes, look up the walk function for the exact node type in the _EXPR_DISPATCH table.
+    # The walk function returns either the bytes of a leaf node,
+    # or the parts of the node, which are pushed back onto the stack in reverse order.
+    # This loop runs once per node and fragment, so the bound methods it uses are kept in locals.
+    stack = list(reversed(parts))
+    pop = stack.pop
+    push = stack.extend
+    extend = out.extend
+    lookup = _EXPR_DISPATCH.get
+    while stack:
+        item = pop()
+        item_type = type(item)
+        if item_type is bytes:
+            extend(item)
+            continue
+        handler = lookup(item_type)
+        if handler is None:
+            raise Exception("Unsupported expression type: " +
+                            str(item_type))
+        item_parts = handler(item)
+        if type(item_parts) is bytes:
+            extend(item_parts)
+        else:
+            push(reversed(item_parts))
 
 
 def get_bin_op_symbol(op: operator):
-    if op.__class__.__name__ == 'Add':
-        return '+'
-    elif op.__class__.__name__ == 'Sub':
-        return '-'
-    elif op.__class__.__name__ == 'Mult':
-        return '*'
-    elif op.__class__.__name__ == 'Div':
-        return '/'
-    elif op.__class__.__name__ == 'Mod':
-        return '%'
-    elif op.__class__.__name__ == 'Pow':
-        return '**'
-    elif op.__class__.__name__ == 'LShift':
-        return '<<'
-    elif op.__class__.__name__ == 'RShift':
-        return '>>'
-    elif op.__class__.__name__ == 'BitOr':
-        return '|'
-    elif op.__class__.__name__ == 'BitXor':
-        return '^'
-    elif op.__class__.__name__ == 'BitAnd':
-        return '&'
-    elif op.__class__.__name__ == 'FloorDiv':
-        return '//'
-    elif op.__class__.__name__ == 'Eq':
-        return '=='
-    elif op.__class__.__name__ == 'NotEq':
-        return '!='
-    elif op.__class__.__name__ == 'Lt':
-        return '<'
-    elif op.__class__.__name__ == 'LtE':
-        return '<='
-    elif op.__class__.__name__ == 'Gt':
-        return '>'
-    elif op.__class__.__name__ == 'GtE':
-        return '>='
-    else:
+    try:
+        return _OP_SYM[type(op)]
+    except KeyError:
         raise Exception("Unsupported binary operator: " +
-                        str(op))
+                        str(op)) from None
+
+
+def get_bin_op_fragment(op: operator):
+    # Return the operator symbol with the spaces around it, as emitted between two operands.
+    try:
+        return _OP_FRAGMENT[type(op)]
+    except KeyError:
+        raise Exception("Unsupported binary operator: " +
+                        str(op)) from None
+
+
+def get_unary_op_fragment(op: unaryop):
+    # Return the operator symbol as emitted in front of the operand.
+    try:
+        return _UNARY_FRAGMENT[type(op)]
+    except KeyError:
+        raise Exception("Unsupported unary operator: " +
+                        str(op)) from None
 
 
 def walk_bin_op(bin_op: BinOp):
@@ -359,10 +632,10 @@ def walk_bin_op(bin_op: BinOp):
     # Example:
     # a + b;
     #
-    # First calculate the left string of the bin_op node left field using the walk_expression function.
-    # Then calculate the right string of the bin_op node right field using the walk_expression function.
-    # Finally, return the binary operation string.
-    return walk_expression(bin_op.left) + ' ' + get_bin_op_symbol(bin_op.op) + ' ' + walk_expression(bin_op.right)
+    # Name and number operands are emitted directly by the leaf_part function,
+    # other left and right nodes are walked by walk_expression_parts.
+    # Return the binary operation parts.
+    return (leaf_part(bin_op.left), get_bin_op_fragment(bin_op.op), leaf_part(bin_op.right))
 
 
 def walk_comp_op(comp_op: Compare):
@@ -374,10 +647,30 @@ def walk_comp_op(comp_op: Compare):
     # Example:
     # a < b;
     #
-    # First calculate the left string of the comp_op node left field using the walk_expression function.
-    # Then calculate the comparators string of the comp_op node comparators field using the walk_expression function.
-    # Finally, return the comparision operation string.
-    return walk_expression(comp_op.left) + ' ' + ' '.join([get_bin_op_symbol(comp_op.ops[i]) + ' ' + walk_expression(comp_op.comparators[i]) for i in range(len(comp_op.comparators))])
+    # Name and number operands are emitted directly by the leaf_part function,
+    # other left and comparators nodes are walked by walk_expression_parts.
+    # Return the comparision operation parts.
+    # The operators and comparators are paired up with zip in a single pass, without indexing either list.
+    parts = [leaf_part(comp_op.left)]
+    append = parts.append
+    for op, comparator in zip(comp_op.ops, comp_op.comparators):
+        append(get_bin_op_fragment(op))
+        append(leaf_part(comparator))
+    return parts
+
+
+def leaf_part(expression: expr):
+    # Name and number leaves are the most common operands.
+    # Return their bytes directly, so walk_expression_parts does not have to dispatch them,
+    # and return any other expression node unchanged.
+    expression_type = type(expression)
+    if expression_type is Name:
+        return expression.id.encode()
+    if expression_type is Constant:
+        value_type = type(expression.value)
+        if value_type is int or value_type is float:
+            return str(expression.value).encode()
+    return expression
 
 
 def walk_unary_op(unary_op):
@@ -388,9 +681,16 @@ def walk_unary_op(unary_op):
     # Example:
     # -a;
     #
-    # First calculate the operand string of the unary_op node operand field using the walk_expression function.
-    # Then return the unary operation string.
-    return unary_op.op.__class__.__name__ + ' ' + walk_expression(unary_op.operand)
+    # The operand node is walked by walk_expression_parts.
+    # Any operand other than a name, constant or call is parenthesized, so that
+    # nested unary operators cannot run together into ++ or -- (e.g. - -a),
+    # and binary operands keep their grouping (e.g. -(a - b)).
+    # Return the unary operation parts.
+    fragment = get_unary_op_fragment(unary_op.op)
+    operand = unary_op.operand
+    if type(operand) in _UNARY_BARE_OPERANDS:
+        return (fragment, leaf_part(operand))
+    return (fragment, _PAREN_OPEN, operand, _PAREN_CLOSE)
 
 
 def walk_lambda(lambda_expression):
@@ -401,19 +701,17 @@ def walk_lambda(lambda_expression):
     # Example:
     # (a, b) => a + b;
     #
-    # First calculate the argument list string of the lambda_expression node args field using the walk_argument_list function.
-    # Then calculate the body string of the lambda_expression node body field using the walk_expression function.
-    # Finally, return the lambda expression string.
-    return '(' + walk_argument_list(lambda_expression.args) + ') => ' + walk_expression(lambda_expression.body)
+    # First calculate the argument list of the lambda_expression node args field using the walk_argument_list function.
+    # The body node is walked by walk_expression_parts.
+    # Finally, return the lambda expression parts.
+    head = bytearray(_LAMBDA_OPEN)
+    walk_argument_list(lambda_expression.args, head)
+    head.extend(_LAMBDA_ARROW)
+    return (bytes(head), lambda_expression.body)
 
 
 def lookup_call_builtins(function_name):
-    if function_name == 'print':
-        return 'Console.WriteLine'
-    elif function_name == 'input':
-        return 'Console.ReadLine'
-    else:
-        return function_name
+    return _BUILTIN.get(function_name, function_name)
 
 
 def walk_call(call: Call):
@@ -424,10 +722,35 @@ def walk_call(call: Call):
     # Example:
     # print(a);
     #
-    # First calculate the function string of the call node func field using the walk_expression function.
-    # Then calculate the argument list string of the call node args field using the walk_expression_list function.
-    # Finally, return the call string.
-    return lookup_call_builtins(walk_expression(call.func)) + '(' + walk_expression_list(call.args) + ')'
+    # First calculate the function string of the call node func field.
+    # Plain names are read directly, other expressions are walked into their own buffer using the walk_expression function.
+    # Then map builtin functions to their C# equivalent in the _BUILTIN table.
+    # Then calculate the argument list parts of the call node args field using the expression_list_parts function.
+    # Finally, return the call parts.
+    func = call.func
+    if type(func) is Name:
+        name = func.id
+    else:
+        func_out = bytearray()
+        walk_expression(func, func_out)
+        name = func_out.decode()
+    parts = expression_list_parts(call.args)
+    parts.insert(0, (_BUILTIN.get(name, name) + '(').encode())
+    parts.append(_CALL_CLOSE)
+    return parts
+
+
+def walk_constant(constant: Constant):
+    # Num and Str nodes are both parsed as Constant nodes,
+    # so pick the walk function from the type of the constant value.
+    value = constant.value
+    if isinstance(value, str):
+        return walk_str(constant)
+    elif isinstance(value, (int, float, complex)) and not isinstance(value, bool):
+        return walk_num(constant)
+    else:
+        raise Exception("Unsupported expression type: " +
+                        str(type(constant)))
 
 
 def walk_num(num):
@@ -438,7 +761,7 @@ def walk_num(num):
     # 1;
     #
     # Return the number string.
-    return str(num.n)
+    return str(num.n).encode()
 
 
 def walk_str(str):
@@ -448,8 +771,15 @@ def walk_str(str):
     # Example:
     # "hello";
     #
-    # Return the string string.
-    return '"' + str.s + '"'
+    # Return the escaped string literal.
+    return escape_string(str.s)
+
+
+@functools.lru_cache(maxsize=4096)
+def escape_string(s):
+    # Quote the string and escape its characters using the _CS_ESCAPE_TABLE table.
+    # The same literals tend to appear many times in a source, so the results are cached.
+    return ('"' + s.translate(_CS_ESCAPE_TABLE) + '"').encode()
 
 
 def walk_name(name):
@@ -460,10 +790,10 @@ def walk_name(name):
     # a;
     #
     # Return the identifier string.
-    return name.id
+    return name.id.encode()
 
 
-def walk_argument_list(argument_list):
+def walk_argument_list(argument_list, out: bytearray):
     # The argument_list node contains the following fields:
     # - args
     #
@@ -471,63 +801,117 @@ def walk_argument_list(argument_list):
     # dynamic a, dynamic b, dynamic c;
     #
     # For each args in argument_list, get their name and add the text "dynamic in front" separated by commas.
-    # Then return the argument list string.
-    return ', '.join(['dynamic ' + argument.arg for argument in argument_list.args])
+    # Append the separators and arguments directly to out.
+    extend = out.extend
+    for index, argument in enumerate(argument_list.args):
+        if index > 0:
+            extend(_COMMA)
+        extend(_DYNAMIC)
+        extend(argument.arg.encode())
 
 
-def walk_expression_list(expression_list: list[expr]):
+def walk_expression_list(expression_list: list[expr], out: bytearray):
     # The expression_list node contains the following fields:
     # - elts
     #
     # Example:
     # [1, 2, 3];
     #
-    # For each elts in expression_list, get their name and add the text "dynamic in front" separated by commas.
-    # Then return the expression list string.
-    return ', '.join([walk_expression(expression) for expression in expression_list])
+    # Walk the parts of the expression list into the output buffer.
+    walk_expression_parts(expression_list_parts(expression_list), out)
+
+
+def expression_list_parts(expression_list: list[expr]):
+    # Return the expressions in expression_list with a comma separator between them.
+    # Name and number arguments are emitted directly by the leaf_part function.
+    parts = []
+    append = parts.append
+    for index, expression in enumerate(expression_list):
+        if index > 0:
+            append(_COMMA)
+        append(leaf_part(expression))
+    return parts
 
 
 def get_expression_return_type(expression: expr):
-    if isinstance(expression, Num):
-        return 'int'
-    elif isinstance(expression, Str):
-        return 'string'
-    elif isinstance(expression, Name):
-        return 'dynamic'
-    elif isinstance(expression, Call):
-        return 'dynamic'
-    elif isinstance(expression, BinOp):
-        return 'dynamic'
-    elif isinstance(expression, Compare):
-        return 'bool'
-    elif isinstance(expression, UnaryOp):
-        return 'dynamic'
-    elif isinstance(expression, Lambda):
-        return 'dynamic'
-    elif isinstance(expression, FunctionDef):
-        return 'dynamic'
-    elif expression == None:
-        return 'dynamic'
-    else:
-        return get_expression_return_type(expression.value)
+    # Look up the C# type of the expression by its exact node type in the _RET_TYPE table,
+    # or by the type of the value for Constant nodes.
+    # Nodes without a known type are resolved through their value field, if they have one.
+    while True:
+        expression_type = type(expression)
+        if expression_type is Constant:
+            return_type = _CONSTANT_RET_TYPE.get(type(expression.value))
+        else:
+            return_type = _RET_TYPE.get(expression_type)
+        if return_type is not None:
+            return return_type
+        expression = getattr(expression, 'value', None)
+
+
+# Walk functions for each statement and expression node type, keyed by the exact node class.
+_STMT_DISPATCH = {
+    FunctionDef: walk_function_def,
+    ClassDef: walk_class_def,
+    Return: walk_return,
+    Assign: walk_assign,
+    For: walk_for,
+    While: walk_while,
+    If: walk_if,
+    Expr: walk_expr_statement,
+}
+
+_EXPR_DISPATCH = {
+    BinOp: walk_bin_op,
+    BoolOp: walk_bin_op,
+    Compare: walk_comp_op,
+    UnaryOp: walk_unary_op,
+    Lambda: walk_lambda,
+    Call: walk_call,
+    Constant: walk_constant,
+    Name: walk_name,
+}
+
+
+USAGE = "usage: py2cs.py INPUT OUTPUT"
+
+HELP = """Transpiler from Python to C#
+
+positional arguments:
+  INPUT       The input python source file
+  OUTPUT      The output C# source file"""
 
 
 def main(argv):
     # Parse the command line arguments
-    parser = argparse.ArgumentParser(
-        description='Transpiler from Python to C#')
-    parser.add_argument('input', help='The input python source file')
-    parser.add_argument('output', help='The output C# source file')
-    args = parser.parse_args()
+    if len(argv) == 2 and argv[1] in ('-h', '--help'):
+        print(USAGE + '\n\n' + HELP)
+        return
+    if len(argv) != 3:
+        sys.exit(USAGE)
+    input_path, output_path = argv[1], argv[2]
 
     # Open the input source file
-    with open(args.input, 'r') as input_file:
-        # Read the input source file
-        source = input_file.read()
-        # Parse the source into an AST
-        tree = ast.parse(source)
-        # Emit the C# code to the output file
-        emit_csharp(args.output, tree)
+    fd = os.open(input_path, os.O_RDONLY)
+    try:
+        st = os.fstat(fd)
+        size = st.st_size
+        # Parse the source into an AST straight from a read-only mapping of a regular file.
+        # compile still copies the mapped source into a bytes object, but the source is
+        # never read into a Python string and decoded by us.
+        # Empty files cannot be mapped, and pipes, FIFOs and /proc files report a size of 0,
+        # so any other input is read as bytes instead.
+        if stat.S_ISREG(st.st_mode) and size > 0:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as source:
+                tree = ast.parse(source, input_path)
+        else:
+            with os.fdopen(fd, 'rb', closefd=False) as input_file:
+                source = input_file.read()
+            size = len(source)
+            tree = ast.parse(source, input_path)
+    finally:
+        os.close(fd)
+    # Emit the C# code to the output file
+    emit_csharp(output_path, tree, size)
 
 
 if __name__ == "__main__":